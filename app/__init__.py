@@ -1,15 +1,36 @@
 """
 Project Nexus - 卡密兑换系统
 """
-from flask import Flask
+from flask import Flask, current_app
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
 import redis
 import os
+import time
+import weakref
+from app.utils import assets, db_router
+from app.utils.db_router import RoutingSession, REPLICA_BIND_PREFIX, replica_bind
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 login_manager = LoginManager()
-redis_client = None
+
+# Redis 客户端在首次使用时才建立连接，避免启动阶段被慢连接阻塞
+_redis_client = None
+_redis_failed_at = None
+REDIS_RETRY_INTERVAL = 30
+
+# 已创建的应用，用于 fork 后重建连接
+_apps = weakref.WeakSet()
+
+
+def _normalize_db_url(db_url):
+    """SQLite 相对路径转绝对路径，并确保目录存在"""
+    if db_url.startswith('sqlite:///') and not db_url.startswith('sqlite:////'):
+        db_path = db_url.replace('sqlite:///', '')
+        db_dir = os.path.dirname(os.path.abspath(db_path))
+        os.makedirs(db_dir, exist_ok=True)
+        return f'sqlite:///{os.path.abspath(db_path)}'
+    return db_url
 
 
 def create_app():
@@ -24,19 +45,23 @@ def create_app():
     
     # 数据库配置
     db_url = os.environ.get('DATABASE_URL', 'sqlite:///data/nexus.db')
-    if db_url.startswith('sqlite:///') and not db_url.startswith('sqlite:////'):
-        # 相对路径转绝对路径
-        db_path = db_url.replace('sqlite:///', '')
-        db_dir = os.path.dirname(os.path.abspath(db_path))
-        os.makedirs(db_dir, exist_ok=True)
-        app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{os.path.abspath(db_path)}'
-    else:
-        app.config['SQLALCHEMY_DATABASE_URI'] = db_url
+    app.config['SQLALCHEMY_DATABASE_URI'] = _normalize_db_url(db_url)
+    
+    # 只读副本配置（逗号分隔，可为空）
+    replica_urls = [u.strip() for u in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if u.strip()]
+    replica_timeout = float(os.environ.get('DATABASE_REPLICA_CONNECT_TIMEOUT', 2))
+    app.config['SQLALCHEMY_BINDS'] = {
+        f'{REPLICA_BIND_PREFIX}{i}': replica_bind(_normalize_db_url(url), replica_timeout)
+        for i, url in enumerate(replica_urls)
+    }
+    app.config['DATABASE_REPLICA_MAX_LAG'] = float(os.environ.get('DATABASE_REPLICA_MAX_LAG', 5))
+    app.config['DATABASE_REPLICA_CHECK_INTERVAL'] = float(os.environ.get('DATABASE_REPLICA_CHECK_INTERVAL', 5))
     
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
     
     # 初始化扩展
     db.init_app(app)
+    db_router.init_app(app, db)
     login_manager.init_app(app)
     login_manager.login_view = 'admin.login'
     
@@ -46,16 +71,20 @@ def create_app():
     def load_user(user_id):
         return None  # 我们不使用 Flask-Login 的用户管理，只用 session
     
-    # 初始化 Redis
-    global redis_client
-    redis_url = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
-    try:
-        redis_client = redis.from_url(redis_url, decode_responses=True)
-        redis_client.ping()
-    except Exception as e:
-        print(f"Warning: Redis connection failed: {e}")
-        print("Running without Redis - concurrent lock disabled")
-        redis_client = None
+    # Redis 配置（连接推迟到首次使用，见 get_redis）
+    app.config['REDIS_URL'] = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
+    
+    # 后台任务配置
+    app.config['JOB_CHUNK_SIZE'] = int(os.environ.get('JOB_CHUNK_SIZE', 200))
+    app.config['JOB_CONCURRENCY'] = int(os.environ.get('JOB_CONCURRENCY', 1))
+    app.config['JOB_CHUNK_PAUSE'] = float(os.environ.get('JOB_CHUNK_PAUSE', 0.05))
+    app.config['JOB_POLL_INTERVAL'] = float(os.environ.get('JOB_POLL_INTERVAL', 2))
+    app.config['JOB_STALE_SECONDS'] = int(os.environ.get('JOB_STALE_SECONDS', 120))
+    app.config['JOB_MAX_ATTEMPTS'] = int(os.environ.get('JOB_MAX_ATTEMPTS', 3))
+    app.config['JOB_EXPORT_DIR'] = os.path.abspath(os.environ.get('JOB_EXPORT_DIR', 'data/exports'))
+    
+    # 静态资源（带哈希、预压缩，长期缓存）
+    assets.init_app(app)
     
     # 注册蓝图
     from app.routes.admin import admin_bp
@@ -64,8 +93,55 @@ def create_app():
     app.register_blueprint(admin_bp)
     app.register_blueprint(redeem_bp)
     
-    # 创建数据库表
-    with app.app_context():
-        db.create_all()
+    # 注册命令行（建表等一次性操作通过 flask init-db 执行，不在每个 worker 启动时进行）
+    from app import cli
+    cli.init_app(app)
     
+    _apps.add(app)
     return app
+
+
+def get_redis():
+    """
+    获取 Redis 客户端
+    
+    首次调用时才连接；连接失败后在 REDIS_RETRY_INTERVAL 秒内直接返回 None，
+    避免每个请求都等待连接超时。
+    
+    Returns:
+        redis.Redis | None: Redis 不可用时返回 None
+    """
+    global _redis_client, _redis_failed_at
+    if _redis_client is not None:
+        return _redis_client
+    if _redis_failed_at is not None and time.monotonic() - _redis_failed_at < REDIS_RETRY_INTERVAL:
+        return None
+    
+    try:
+        client = redis.from_url(current_app.config['REDIS_URL'], decode_responses=True,
+                                socket_connect_timeout=2)
+        client.ping()
+    except Exception as e:
+        print(f"Warning: Redis connection failed: {e}")
+        print("Running without Redis - concurrent lock disabled")
+        _redis_failed_at = time.monotonic()
+        return None
+    
+    _redis_client = client
+    _redis_failed_at = None
+    return client
+
+
+def _reset_connections_after_fork():
+    """fork 后丢弃从父进程继承的连接，子进程按需重新建立"""
+    global _redis_client, _redis_failed_at
+    _redis_client = None
+    _redis_failed_at = None
+    for app in list(_apps):
+        with app.app_context():
+            for engine in db.engines.values():
+                engine.dispose(close=False)
+
+
+# 兼容 gunicorn --preload：worker fork 后重建数据库和 Redis 连接
+os.register_at_fork(after_in_child=_reset_connections_after_fork)
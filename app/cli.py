@@ -0,0 +1,33 @@
+"""
+命令行工具
+一次性的部署任务，与 Web worker 启动解耦
+"""
+import click
+from flask import current_app
+from app import db
+from app.utils import assets
+
+
+def init_app(app):
+    """注册命令行"""
+    app.cli.add_command(init_db)
+    app.cli.add_command(build_assets)
+
+
+@click.command('init-db')
+def init_db():
+    """创建数据库表（部署或升级时执行一次）"""
+    # 只在主库建表，只读副本的表结构由数据库复制同步
+    db.create_all(bind_key=None)
+    click.echo('Database initialized')
+
+
+@click.command('build-assets')
+def build_assets():
+    """生成带哈希的静态资源及 gzip/brotli 预压缩文件"""
+    manifest = assets.build_assets(current_app.static_folder)
+    current_app.extensions['asset_manifest'] = manifest
+    for source, target in sorted(manifest.items()):
+        click.echo(f'{source} -> {target}')
+    if assets.brotli is None:
+        click.echo('Warning: brotli not installed, only gzip variants were generated')
@@ -3,6 +3,7 @@
 """
 from datetime import datetime
 from app import db
+import json
 import secrets
 import string
 
@@ -114,3 +115,58 @@ class RedeemCode(db.Model):
             'last_used_at': self.last_used_at.isoformat() if self.last_used_at else None,
             'view_count': self.view_count
         }
+
+
+class Job(db.Model):
+    """后台任务（导入、生成、导出、对账）"""
+    __tablename__ = 'jobs'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(32), nullable=False)  # import_cards, generate_codes, export_codes, reconcile
+    status = db.Column(db.String(20), default='pending', index=True)  # pending, running, succeeded, failed
+    
+    params = db.Column(db.Text)  # 任务参数 (JSON格式)
+    checkpoint = db.Column(db.Text)  # 断点状态 (JSON格式)，与每个分块的数据在同一事务中提交
+    total = db.Column(db.Integer, default=0)  # 需处理的总量
+    progress = db.Column(db.Integer, default=0)  # 已处理数量
+    message = db.Column(db.Text)  # 结果说明
+    error = db.Column(db.Text)  # 失败原因
+    attempts = db.Column(db.Integer, default=0)  # 执行次数（含崩溃后重试）
+    worker = db.Column(db.String(128))  # 领取任务的 worker（主机名:pid:启动标识）
+    
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    heartbeat_at = db.Column(db.DateTime)  # 最近一次提交分块的时间，用于判断 worker 是否崩溃
+    
+    def get_params(self):
+        return json.loads(self.params) if self.params else {}
+    
+    def get_checkpoint(self):
+        return json.loads(self.checkpoint) if self.checkpoint else {}
+    
+    @property
+    def percent(self):
+        """完成百分比"""
+        if self.status == 'succeeded':
+            return 100
+        if not self.total:
+            return 0
+        return min(100, int(self.progress * 100 / self.total))
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'total': self.total,
+            'progress': self.progress,
+            'percent': self.percent,
+            'message': self.message,
+            'error': self.error,
+            'attempts': self.attempts,
+            'worker': self.worker,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
@@ -1,12 +1,17 @@
 """
 管理后台路由
 """
-from flask import Blueprint, render_template, request, jsonify, redirect, url_for, flash, current_app, session
+from flask import Blueprint, render_template, request, jsonify, redirect, url_for, flash, current_app, session, \
+    send_file, abort
 from functools import wraps
 from app import db
-from app.models import Group, Card, RedeemCode
-from datetime import datetime, timedelta
-import json
+from app.models import Group, Card, RedeemCode, Job
+from app.services.job_service import enqueue, export_path, JOB_KINDS
+from app.utils.db_router import read_replica
+import os
+
+# 单次生成兑换码的数量上限（后台任务分块执行）
+MAX_GENERATE_COUNT = 100000
 
 admin_bp = Blueprint('admin', __name__, url_prefix='/console')
 
@@ -45,6 +50,7 @@ def logout():
 @admin_bp.route('/')
 @admin_bp.route('/dashboard')
 @login_required
+@read_replica
 def dashboard():
     """仪表盘"""
     # 统计数据
@@ -70,6 +76,7 @@ def dashboard():
 
 @admin_bp.route('/groups')
 @login_required
+@read_replica
 def groups():
     """分组列表"""
     groups = Group.query.order_by(Group.id.desc()).all()
@@ -117,6 +124,7 @@ def delete_group(group_id):
 
 @admin_bp.route('/cards')
 @login_required
+@read_replica
 def cards():
     """卡密列表"""
     group_id = request.args.get('group_id', type=int)
@@ -151,67 +159,14 @@ def add_cards():
         flash('请输入卡密信息', 'error')
         return redirect(url_for('admin.cards'))
     
-    group = Group.query.get_or_404(group_id)
+    Group.query.get_or_404(group_id)
     
-    # 解析卡密
-    # 支持格式：
-    # 1. 账号----密码
-    # 2. 账号----密码----2FA密钥
-    # 3. 账号----密码----2FA密钥----其他信息
-    # 4. JSON 格式
-    count = 0
-    for line in cards_text.split('\n'):
-        line = line.strip()
-        if not line:
-            continue
-        
-        try:
-            account = ''
-            password = ''
-            totp_secret = None
-            extra = None
-            
-            # 尝试 JSON 格式
-            if line.startswith('{'):
-                data = json.loads(line)
-                account = data.get('account', '')
-                password = data.get('password', '')
-                totp_secret = data.get('totp_secret', data.get('2fa', data.get('totp', '')))
-                # 剩余字段作为 extra_info
-                extra_data = {k: v for k, v in data.items() 
-                             if k not in ('account', 'password', 'totp_secret', '2fa', 'totp')}
-                if extra_data:
-                    extra = json.dumps(extra_data, ensure_ascii=False)
-            else:
-                # 分隔符格式: 账号----密码----2FA密钥----其他
-                parts = line.split('----')
-                account = parts[0].strip() if len(parts) > 0 else ''
-                password = parts[1].strip() if len(parts) > 1 else ''
-                totp_secret = parts[2].strip() if len(parts) > 2 else None
-                extra = '----'.join(parts[3:]).strip() if len(parts) > 3 else None
-                
-                # 清理空值
-                if totp_secret == '':
-                    totp_secret = None
-                if extra == '':
-                    extra = None
-            
-            if account and password:
-                card = Card(
-                    account=account,
-                    password=password,
-                    totp_secret=totp_secret,
-                    extra_info=extra,
-                    group_id=group_id
-                )
-                db.session.add(card)
-                count += 1
-        except Exception as e:
-            continue
+    # 交给后台任务分块导入，格式解析见 job_service.parse_card_line
+    lines = [line for line in cards_text.split('\n') if line.strip()]
+    job = enqueue('import_cards', {'group_id': group_id, 'lines': lines}, total=len(lines))
     
-    db.session.commit()
-    flash(f'成功添加 {count} 张卡密', 'success')
-    return redirect(url_for('admin.cards', group_id=group_id))
+    flash(f'导入任务 #{job.id} 已提交，共 {len(lines)} 行', 'success')
+    return redirect(url_for('admin.jobs'))
 
 
 @admin_bp.route('/cards/<int:card_id>/delete', methods=['POST'])
@@ -232,6 +187,7 @@ def delete_card(card_id):
 
 @admin_bp.route('/codes')
 @login_required
+@read_replica
 def codes():
     """兑换码列表"""
     group_id = request.args.get('group_id', type=int)
@@ -257,42 +213,21 @@ def generate_codes():
     """批量生成兑换码"""
     group_id = request.form.get('group_id', type=int)
     count = request.form.get('count', 1, type=int)
-    expires_days = request.form.get('expires_days', type=int)
     
     if not group_id:
         flash('请选择分组', 'error')
         return redirect(url_for('admin.codes'))
     
-    if count < 1 or count > 1000:
-        flash('生成数量应在 1-1000 之间', 'error')
+    if count < 1 or count > MAX_GENERATE_COUNT:
+        flash(f'生成数量应在 1-{MAX_GENERATE_COUNT} 之间', 'error')
         return redirect(url_for('admin.codes'))
     
-    group = Group.query.get_or_404(group_id)
-    
-    expires_at = None
-    if expires_days and expires_days > 0:
-        expires_at = datetime.utcnow() + timedelta(days=expires_days)
-    
-    generated = []
-    for _ in range(count):
-        # 生成唯一兑换码
-        while True:
-            code = RedeemCode.generate_code()
-            if not RedeemCode.query.filter_by(code=code).first():
-                break
-        
-        redeem_code = RedeemCode(
-            code=code,
-            group_id=group_id,
-            expires_at=expires_at
-        )
-        db.session.add(redeem_code)
-        generated.append(code)
+    Group.query.get_or_404(group_id)
     
-    db.session.commit()
+    job = enqueue('generate_codes', {'group_id': group_id, 'count': count}, total=count)
     
-    flash(f'成功生成 {count} 个兑换码', 'success')
-    return redirect(url_for('admin.codes', group_id=group_id))
+    flash(f'生成任务 #{job.id} 已提交，共 {count} 个兑换码', 'success')
+    return redirect(url_for('admin.jobs'))
 
 
 @admin_bp.route('/codes/<int:code_id>/delete', methods=['POST'])
@@ -309,23 +244,61 @@ def delete_code(code_id):
     return redirect(url_for('admin.codes', group_id=group_id))
 
 
-@admin_bp.route('/codes/export')
+@admin_bp.route('/codes/export', methods=['POST'])
 @login_required
+@read_replica
 def export_codes():
-    """导出兑换码"""
-    group_id = request.args.get('group_id', type=int)
-    status = request.args.get('status', 'unused')
+    """导出兑换码（后台任务）"""
+    group_id = request.form.get('group_id', type=int)
+    status = request.form.get('status', 'unused')
     
     query = RedeemCode.query.filter_by(status=status)
     if group_id:
         query = query.filter_by(group_id=group_id)
     
-    codes = query.all()
+    job = enqueue('export_codes', {'group_id': group_id, 'status': status}, total=query.count())
     
-    # 返回纯文本格式
-    text = '\n'.join([c.code for c in codes])
-    
-    return text, 200, {
-        'Content-Type': 'text/plain; charset=utf-8',
-        'Content-Disposition': f'attachment; filename=codes_{status}.txt'
-    }
+    flash(f'导出任务 #{job.id} 已提交', 'success')
+    return redirect(url_for('admin.jobs'))
+
+
+# ==================== 后台任务 ====================
+
+@admin_bp.route('/jobs')
+@login_required
+def jobs():
+    """任务列表"""
+    jobs = Job.query.order_by(Job.id.desc()).limit(50).all()
+    return render_template('admin/jobs.html', jobs=jobs, job_kinds=JOB_KINDS)
+
+
+@admin_bp.route('/jobs/reconcile', methods=['POST'])
+@login_required
+@read_replica
+def reconcile():
+    """提交库存对账任务"""
+    job = enqueue('reconcile', {}, total=Card.query.count())
+    flash(f'对账任务 #{job.id} 已提交', 'success')
+    return redirect(url_for('admin.jobs'))
+
+
+@admin_bp.route('/jobs/<int:job_id>')
+@login_required
+def job_status(job_id):
+    """任务状态（供页面轮询进度）"""
+    job = Job.query.get_or_404(job_id)
+    return jsonify(job.to_dict())
+
+
+@admin_bp.route('/jobs/<int:job_id>/download')
+@login_required
+def download_job(job_id):
+    """下载导出任务的结果文件"""
+    job = Job.query.get_or_404(job_id)
+    path = export_path(job)
+    if job.kind != 'export_codes' or job.status != 'succeeded' or not path or not os.path.isfile(path):
+        abort(404)
+    
+    status = job.get_params().get('status', 'unused')
+    return send_file(path, mimetype='text/plain; charset=utf-8', as_attachment=True,
+                     download_name=f'codes_{status}.txt')
@@ -1,16 +1,32 @@
 """
 兑换相关路由（公开接口）
 """
-from flask import Blueprint, render_template, request, jsonify
+import os
+from datetime import datetime, timezone
+from flask import Blueprint, render_template, request, jsonify, make_response, current_app
 from app.services.redeem_service import redeem_card, RedeemError
+from app.utils.assets import manifest_mtime
 
 redeem_bp = Blueprint('redeem', __name__)
 
 
 @redeem_bp.route('/')
 def index():
-    """兑换页面"""
-    return render_template('public/redeem.html')
+    """兑换页面（支持 ETag/Last-Modified 协商缓存）"""
+    response = make_response(render_template('public/redeem.html'))
+    response.add_etag()
+    response.last_modified = _index_last_modified()
+    # 允许缓存但每次校验，静态资源更新后页面能及时引用新的哈希文件
+    response.cache_control.public = True
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+
+def _index_last_modified():
+    """兑换页面的最后修改时间：模板与静态资源清单中较新者"""
+    template = os.path.join(current_app.root_path, current_app.template_folder, 'public', 'redeem.html')
+    mtimes = [os.path.getmtime(template), manifest_mtime(current_app.static_folder) or 0]
+    return datetime.fromtimestamp(max(mtimes), tz=timezone.utc)
 
 
 @redeem_bp.route('/api/redeem', methods=['POST'])
@@ -0,0 +1,578 @@
+"""
+后台任务服务
+批量导入、生成、导出和对账按分块执行，每个分块与断点在同一事务中提交，
+worker 崩溃后从最后一次提交的断点继续。
+
+任务状态始终保存在数据库中；Redis 可用时用作唤醒队列，不可用时 worker 轮询数据库。
+"""
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import select, update
+from sqlalchemy.exc import DBAPIError, OperationalError
+from app import db, get_redis
+from app.models import Job, Card, RedeemCode
+from app.utils import db_router
+from app.utils.lock import RedisLock
+
+QUEUE_KEY = 'jobs:queue'
+
+# 任务结束后从 params 中清除的敏感字段（导入的账号密码不应长期保存在任务表中）
+SENSITIVE_PARAMS = {
+    'import_cards': ('lines',),
+}
+
+JOB_KINDS = {
+    'import_cards': '导入卡密',
+    'generate_codes': '生成兑换码',
+    'export_codes': '导出兑换码',
+    'reconcile': '库存对账',
+}
+
+
+class JobError(Exception):
+    """任务错误"""
+    pass
+
+
+# ==================== 提交与查询 ====================
+
+def enqueue(kind: str, params: dict, total: int = 0) -> Job:
+    """
+    创建任务并通知 worker
+
+    Args:
+        kind: 任务类型，见 JOB_KINDS
+        params: 任务参数
+        total: 需处理的总量（用于进度显示）
+
+    Returns:
+        Job: 新建的任务
+    """
+    if kind not in JOB_HANDLERS:
+        raise JobError(f"未知的任务类型: {kind}")
+
+    job = Job(kind=kind, params=json.dumps(params, ensure_ascii=False), total=total)
+    db.session.add(job)
+    db.session.commit()
+
+    redis_client = get_redis()
+    if redis_client is not None:
+        try:
+            redis_client.lpush(QUEUE_KEY, job.id)
+        except Exception as e:
+            # 任务已落库，worker 轮询时仍会领取
+            current_app.logger.warning(f"Failed to notify job worker: {e}")
+    return job
+
+
+def export_path(job: Job):
+    """导出任务的结果文件路径，尚未写出文件时返回 None"""
+    name = job.get_checkpoint().get('file')
+    if not name:
+        return None
+    return os.path.join(current_app.config['JOB_EXPORT_DIR'], name)
+
+
+# ==================== Worker ====================
+
+def run_worker(once=False):
+    """
+    worker 主循环
+
+    每个领取到的任务在独立线程中执行，单个 worker 最多同时运行 JOB_CONCURRENCY 个任务；
+    领取时的条件更新保证所有 worker 合计不超过该上限。
+
+    Args:
+        once: 处理完当前可领取的任务后退出（用于定时任务或调试）
+    """
+    app = current_app._get_current_object()
+    worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+    current_app.logger.info(f"Job worker started ({worker_id})")
+
+    threads = []
+    while True:
+        threads = [t for t in threads if t.is_alive()]
+        _requeue_orphaned_jobs(worker_id)
+        _requeue_stale_jobs()
+
+        if len(threads) < current_app.config['JOB_CONCURRENCY']:
+            claimed = _claim_next_job(worker_id)
+            if claimed is not None:
+                thread = threading.Thread(target=_run_job_thread, args=(app, *claimed),
+                                          name=f'job-{claimed[0]}', daemon=True)
+                thread.start()
+                threads.append(thread)
+                continue
+
+        # 主线程的会话只用于领取任务，每轮丢弃以免读到旧数据
+        db.session.remove()
+        if once and not threads:
+            return
+        _wait_for_jobs()
+
+
+def _wait_for_jobs():
+    """等待新任务：优先阻塞在 Redis 队列上，否则按间隔轮询"""
+    interval = current_app.config['JOB_POLL_INTERVAL']
+    redis_client = get_redis()
+    if redis_client is not None:
+        try:
+            redis_client.brpop(QUEUE_KEY, timeout=max(1, int(interval)))
+            return
+        except Exception as e:
+            current_app.logger.warning(f"Job queue wait failed: {e}")
+    time.sleep(interval)
+
+
+def _requeue_stale_jobs():
+    """心跳超时的运行中任务视为 worker 崩溃，重新排队或标记失败"""
+    now = datetime.utcnow()
+    stale = (Job.status == 'running',
+             Job.heartbeat_at < now - timedelta(seconds=current_app.config['JOB_STALE_SECONDS']))
+    db.session.execute(
+        update(Job)
+        .where(*stale, Job.attempts >= current_app.config['JOB_MAX_ATTEMPTS'])
+        .values(status='failed', error='worker 多次中断，任务已放弃', finished_at=now)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.execute(
+        update(Job)
+        .where(*stale)
+        .values(status='pending', worker=None)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+
+
+def _requeue_orphaned_jobs(worker_id):
+    """
+    立即回收本机上已退出的 worker 留下的运行中任务
+
+    worker 被强制终止后重启时，无需等待 JOB_STALE_SECONDS 心跳超时。
+    其他主机上的 worker 无法判断存活，仍按心跳超时处理。
+    """
+    host, pid, token = worker_id.rsplit(':', 2)
+    jobs = Job.query.filter(Job.status == 'running', Job.worker.like(f'{host}:%')).all()
+    for job in jobs:
+        if not _worker_gone(job.worker, host, int(pid), token):
+            continue
+        exhausted = job.attempts >= current_app.config['JOB_MAX_ATTEMPTS']
+        values = ({'status': 'failed', 'error': 'worker 多次中断，任务已放弃', 'finished_at': datetime.utcnow()}
+                  if exhausted else {'status': 'pending', 'worker': None})
+        db.session.execute(
+            update(Job)
+            .where(Job.id == job.id, Job.status == 'running', Job.worker == job.worker)
+            .values(**values)
+            .execution_options(synchronize_session=False)
+        )
+    db.session.commit()
+
+
+def _worker_gone(owner, host, pid, token):
+    """判断本机上领取任务的 worker 进程是否已退出"""
+    try:
+        owner_host, owner_pid, owner_token = owner.rsplit(':', 2)
+        owner_pid = int(owner_pid)
+    except ValueError:
+        return False
+    if owner_host != host:
+        return False
+    if owner_pid == pid:
+        # 同一 pid 但启动标识不同：容器重启后 pid 被复用
+        return owner_token != token
+    try:
+        os.kill(owner_pid, 0)
+    except ProcessLookupError:
+        return True
+    except PermissionError:
+        return False
+    return False
+
+
+def _claim_next_job(worker_id):
+    """
+    领取最早的待处理任务
+
+    运行中的任务数与领取在同一条 UPDATE 中判断，达到 JOB_CONCURRENCY 时不领取，
+    避免批量任务挤占兑换所需的数据库资源。
+
+    Returns:
+        tuple | None: (任务 id, 本次领取后的 attempts)
+    """
+    job = Job.query.filter_by(status='pending').order_by(Job.id).first()
+    if job is None:
+        return None
+    job_id, attempts = job.id, job.attempts or 0
+
+    # 子查询包一层派生表，兼容 MySQL 不允许在 UPDATE 中直接查询目标表
+    running = select(db.func.count()).select_from(
+        select(Job.id).where(Job.status == 'running').subquery()).scalar_subquery()
+    now = datetime.utcnow()
+
+    # SQLite 的写锁使该语句天然串行；其他数据库在有 Redis 时再加一层锁
+    lock = RedisLock('jobs:claim')
+    if not lock.acquire():
+        return None
+    try:
+        claimed = db.session.execute(
+            update(Job)
+            .where(Job.id == job_id, Job.status == 'pending', db.func.coalesce(Job.attempts, 0) == attempts,
+                   running < current_app.config['JOB_CONCURRENCY'])
+            .values(status='running', attempts=attempts + 1, worker=worker_id, heartbeat_at=now,
+                    started_at=db.func.coalesce(Job.started_at, now))
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        db.session.commit()
+    finally:
+        lock.release()
+
+    return (job_id, attempts + 1) if claimed else None
+
+
+def _run_job_thread(app, job_id, attempts):
+    """任务线程入口"""
+    with app.app_context():
+        try:
+            _run_job(job_id, attempts)
+        finally:
+            db.session.remove()
+
+
+def _run_job(job_id, attempts):
+    """
+    按分块执行任务直到完成
+
+    每块的数据与断点在同一事务中提交；断点通过带 attempts 条件的 UPDATE 写入，
+    任务已被其他 worker 接管时该更新不匹配任何行，本块回滚并放弃任务。
+    """
+    job = db.session.get(Job, job_id)
+    if job is None or job.attempts != attempts or job.status != 'running':
+        return
+
+    kind = job.kind
+    handler = JOB_HANDLERS[kind]
+    params = job.get_params()
+    state = job.get_checkpoint()
+    pause = current_app.config['JOB_CHUNK_PAUSE']
+    owned = (Job.id == job_id, Job.attempts == attempts, Job.status == 'running')
+
+    heartbeat = _Heartbeat(db.engine, owned, current_app.config['JOB_STALE_SECONDS'] / 4,
+                           current_app.logger)
+    heartbeat.start()
+    try:
+        while not heartbeat.lost:
+            done, message = handler(job, params, state)
+            now = datetime.utcnow()
+            values = {
+                'checkpoint': json.dumps(state, ensure_ascii=False),
+                'progress': state.get('progress', 0),
+                'message': message,
+                'heartbeat_at': now,
+            }
+            if done:
+                values.update(status='succeeded', finished_at=now,
+                              params=_strip_sensitive_params(kind, params))
+
+            if not _update_owned_job(owned, values):
+                db.session.rollback()
+                break
+            db.session.commit()
+            if done:
+                return
+            # 分块之间让出数据库，保证兑换请求优先
+            time.sleep(pause)
+
+        current_app.logger.warning(f"Job {job_id} was taken over by another worker, abandoning")
+    except DBAPIError as e:
+        db.session.rollback()
+        if not _is_transient(e):
+            _fail_owned_job(owned, kind, params, e)
+            current_app.logger.exception(f"Job {job_id} failed")
+        elif attempts >= current_app.config['JOB_MAX_ATTEMPTS']:
+            _fail_owned_job(owned, kind, params, e)
+            current_app.logger.exception(f"Job {job_id} failed after {attempts} attempts")
+        else:
+            # 数据库临时故障（如 SQLite 锁等待超时、连接中断）：重新排队，从已提交的断点继续
+            _release_owned_job(owned)
+            current_app.logger.warning(f"Job {job_id} hit a database error, requeued: {e}")
+    except Exception as e:
+        db.session.rollback()
+        _fail_owned_job(owned, kind, params, e)
+        current_app.logger.exception(f"Job {job_id} failed")
+    finally:
+        heartbeat.stop()
+
+
+def _is_transient(error):
+    """是否为可重试的数据库错误"""
+    return isinstance(error, OperationalError) or error.connection_invalidated
+
+
+def _fail_owned_job(owned, kind, params, error):
+    """将仍持有的任务标记为失败"""
+    try:
+        _update_owned_job(owned, {'status': 'failed', 'error': str(error), 'finished_at': datetime.utcnow(),
+                                  'params': _strip_sensitive_params(kind, params)})
+        db.session.commit()
+    except DBAPIError:
+        # 数据库仍不可用，交给心跳超时回收
+        db.session.rollback()
+
+
+def _release_owned_job(owned):
+    """释放仍持有的任务，重新排队"""
+    try:
+        _update_owned_job(owned, {'status': 'pending', 'worker': None})
+        db.session.commit()
+    except DBAPIError:
+        db.session.rollback()
+
+
+def _strip_sensitive_params(kind, params):
+    """去除敏感字段后的 params（JSON）"""
+    sensitive = SENSITIVE_PARAMS.get(kind, ())
+    return json.dumps({k: v for k, v in params.items() if k not in sensitive}, ensure_ascii=False)
+
+
+def _read_bind():
+    """只读扫描的 bind 参数：有可用副本时读副本，否则为 None（主库）"""
+    replica = db_router._pick_replica(db)
+    return {'bind': replica} if replica is not None else None
+
+
+def _update_owned_job(owned, values):
+    """仅在仍持有任务时更新，返回是否更新成功"""
+    return db.session.execute(
+        update(Job).where(*owned).values(**values).execution_options(synchronize_session=False)
+    ).rowcount == 1
+
+
+class _Heartbeat(threading.Thread):
+    """
+    任务心跳线程
+
+    单个分块耗时较长（如等待 SQLite 写锁）时仍定期刷新 heartbeat_at，
+    避免任务被误判为崩溃；发现任务已被接管时设置 lost。
+    """
+
+    def __init__(self, engine, owned, interval, logger):
+        super().__init__(daemon=True)
+        self.engine = engine
+        self.owned = owned
+        self.interval = interval
+        self.logger = logger
+        self.lost = False
+        self._halt = threading.Event()
+
+    def run(self):
+        while not self._halt.wait(self.interval):
+            try:
+                with self.engine.begin() as conn:
+                    rowcount = conn.execute(
+                        update(Job.__table__).where(*self.owned).values(heartbeat_at=datetime.utcnow())
+                    ).rowcount
+            except Exception as e:
+                self.logger.warning(f"Job heartbeat failed: {e}")
+                continue
+            if rowcount == 0:
+                self.lost = True
+                return
+
+    def stop(self):
+        self._halt.set()
+        self.join()
+
+
+# ==================== 任务实现 ====================
+# 每个处理函数执行一个分块：修改 state（含 state['progress']），返回 (是否已全部完成, 结果说明)。
+# 分块内的数据变更与断点由 _run_job 一并提交；job 只读，不要修改。
+
+def _import_cards(job, params, state):
+    """批量导入卡密"""
+    lines = params['lines']
+    start = state.get('offset', 0)
+    end = min(start + current_app.config['JOB_CHUNK_SIZE'], len(lines))
+
+    added = 0
+    for line in lines[start:end]:
+        data = parse_card_line(line)
+        if data:
+            db.session.add(Card(group_id=params['group_id'], **data))
+            added += 1
+
+    state['offset'] = end
+    state['added'] = state.get('added', 0) + added
+    state['progress'] = end
+    return end >= len(lines), f"成功添加 {state['added']} 张卡密"
+
+
+def _generate_codes(job, params, state):
+    """批量生成兑换码"""
+    generated = state.get('generated', 0)
+    batch = min(current_app.config['JOB_CHUNK_SIZE'], params['count'] - generated)
+
+    codes = set()
+    while len(codes) < batch:
+        candidates = {RedeemCode.generate_code() for _ in range(batch - len(codes))} - codes
+        existing = {c for (c,) in db.session.query(RedeemCode.code).filter(RedeemCode.code.in_(candidates))}
+        codes |= candidates - existing
+
+    for code in codes:
+        db.session.add(RedeemCode(code=code, group_id=params['group_id']))
+
+    state['generated'] = generated + batch
+    state['progress'] = state['generated']
+    return state['generated'] >= params['count'], f"成功生成 {state['generated']} 个兑换码"
+
+
+def _export_codes(job, params, state):
+    """导出兑换码到文件（按 id 游标分块）"""
+    export_dir = current_app.config['JOB_EXPORT_DIR']
+    os.makedirs(export_dir, exist_ok=True)
+
+    # 每次领取写入独立文件并先复制已提交的部分，被接管的旧 worker 不会写坏当前文件
+    name = f'job_{job.id}_{job.attempts}.txt'
+    path = os.path.join(export_dir, name)
+    if state.get('file') != name:
+        _copy_committed_export(state, path)
+        state['file'] = name
+
+    # 只读扫描走副本，断点仍由 _run_job 写入主库
+    query = select(RedeemCode.id, RedeemCode.code).where(
+        RedeemCode.status == params['status'], RedeemCode.id > state.get('last_id', 0))
+    if params.get('group_id'):
+        query = query.where(RedeemCode.group_id == params['group_id'])
+    codes = db.session.execute(
+        query.order_by(RedeemCode.id).limit(current_app.config['JOB_CHUNK_SIZE']),
+        bind_arguments=_read_bind()).all()
+
+    # 截断到上次提交的位置，丢弃崩溃前写入但未记录断点的内容
+    with open(path, 'ab') as f:
+        f.truncate(state.get('bytes', 0))
+        f.write(''.join(f'{c.code}\n' for c in codes).encode('utf-8'))
+        state['bytes'] = f.tell()
+
+    if codes:
+        state['last_id'] = codes[-1].id
+    state['progress'] = state.get('progress', 0) + len(codes)
+    done = len(codes) < current_app.config['JOB_CHUNK_SIZE']
+    return done, f"已导出 {state['progress']} 个兑换码"
+
+
+def _copy_committed_export(state, path):
+    """把上一次执行已提交的导出内容复制到新文件"""
+    size = state.get('bytes', 0)
+    data = b''
+    if state.get('file'):
+        previous = os.path.join(os.path.dirname(path), state['file'])
+        try:
+            with open(previous, 'rb') as f:
+                data = f.read(size)
+        except OSError:
+            pass
+    if len(data) < size:
+        raise JobError("导出文件已丢失，无法继续")
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def _reconcile(job, params, state):
+    """核对卡密与兑换码的绑定关系，只记录异常不做修改"""
+    # 只读扫描走副本
+    cards = db.session.execute(
+        select(Card.id, Card.status, Card.redeem_code_id, RedeemCode.id.label('code_id'),
+               RedeemCode.code, RedeemCode.status.label('code_status'))
+        .outerjoin(RedeemCode, Card.redeem_code_id == RedeemCode.id)
+        .where(Card.id > state.get('last_id', 0))
+        .order_by(Card.id)
+        .limit(current_app.config['JOB_CHUNK_SIZE']),
+        bind_arguments=_read_bind()).all()
+
+    issues = []
+    for card in cards:
+        if card.status == 'assigned' and card.code_id is None:
+            issues.append(f"卡密 #{card.id} 已分配但未绑定兑换码")
+        elif card.status == 'available' and card.redeem_code_id:
+            issues.append(f"卡密 #{card.id} 可用但关联了兑换码 #{card.redeem_code_id}")
+        elif card.code_id is not None and card.code_status != 'active':
+            issues.append(f"兑换码 {card.code} 已绑定卡密但状态为 {card.code_status}")
+
+    # 只保留前 100 条明细，避免断点数据无限增长
+    state['issue_count'] = state.get('issue_count', 0) + len(issues)
+    state['issues'] = (state.get('issues', []) + issues)[:100]
+
+    if cards:
+        state['last_id'] = cards[-1].id
+    state['progress'] = state.get('progress', 0) + len(cards)
+    message = f"已核对 {state['progress']} 张卡密，发现 {state['issue_count']} 处异常"
+    if state['issues']:
+        message += '\n' + '\n'.join(state['issues'])
+    return len(cards) < current_app.config['JOB_CHUNK_SIZE'], message
+
+
+JOB_HANDLERS = {
+    'import_cards': _import_cards,
+    'generate_codes': _generate_codes,
+    'export_codes': _export_codes,
+    'reconcile': _reconcile,
+}
+
+
+def parse_card_line(line: str):
+    """
+    解析一行卡密
+
+    支持格式：
+    1. 账号----密码
+    2. 账号----密码----2FA密钥
+    3. 账号----密码----2FA密钥----其他信息
+    4. JSON 格式
+
+    Returns:
+        dict | None: Card 字段，无法解析时返回 None
+    """
+    line = line.strip()
+    if not line:
+        return None
+
+    try:
+        # 尝试 JSON 格式
+        if line.startswith('{'):
+            data = json.loads(line)
+            account = data.get('account', '')
+            password = data.get('password', '')
+            totp_secret = data.get('totp_secret', data.get('2fa', data.get('totp', '')))
+            # 剩余字段作为 extra_info
+            extra_data = {k: v for k, v in data.items()
+                          if k not in ('account', 'password', 'totp_secret', '2fa', 'totp')}
+            extra = json.dumps(extra_data, ensure_ascii=False) if extra_data else None
+        else:
+            # 分隔符格式: 账号----密码----2FA密钥----其他
+            parts = line.split('----')
+            account = parts[0].strip() if len(parts) > 0 else ''
+            password = parts[1].strip() if len(parts) > 1 else ''
+            totp_secret = parts[2].strip() if len(parts) > 2 else None
+            extra = '----'.join(parts[3:]).strip() if len(parts) > 3 else None
+
+            # 清理空值
+            if totp_secret == '':
+                totp_secret = None
+            if extra == '':
+                extra = None
+    except Exception:
+        return None
+
+    if not (account and password):
+        return None
+    return {
+        'account': account,
+        'password': password,
+        'totp_secret': totp_secret,
+        'extra_info': extra
+    }
@@ -0,0 +1,157 @@
+"""
+静态资源管线
+构建时压缩 CSS、加内容哈希并预压缩 gzip/brotli，运行时直接发送预压缩文件
+"""
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import shutil
+from flask import current_app, request, send_from_directory, url_for
+from werkzeug.security import safe_join
+
+try:
+    import brotli
+except ImportError:  # brotli 为可选依赖，缺失时只生成 gzip
+    brotli = None
+
+# 构建产物目录（相对 static 目录）
+DIST_DIR = 'dist'
+MANIFEST_NAME = 'manifest.json'
+
+# 参与构建的资源目录
+ASSET_DIRS = ('css', 'js')
+
+# 带哈希的文件内容不会变化，可长期缓存
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+# 按优先级排列的预压缩格式
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+def init_app(app):
+    """注册 asset_url 模板函数，并接管 static 路由"""
+    app.extensions['asset_manifest'] = load_manifest(app.static_folder)
+    app.jinja_env.globals['asset_url'] = asset_url
+    app.view_functions['static'] = serve_static
+
+
+def load_manifest(static_folder):
+    """读取构建清单，未构建时返回空字典"""
+    path = os.path.join(static_folder, DIST_DIR, MANIFEST_NAME)
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def manifest_mtime(static_folder):
+    """构建清单的修改时间，未构建时返回 None"""
+    try:
+        return os.path.getmtime(os.path.join(static_folder, DIST_DIR, MANIFEST_NAME))
+    except OSError:
+        return None
+
+
+def asset_url(path):
+    """
+    获取静态资源地址
+
+    已构建时返回带内容哈希的文件，否则回退到原始文件
+    """
+    manifest = current_app.extensions.get('asset_manifest', {})
+    return url_for('static', filename=manifest.get(path, path))
+
+
+def serve_static(filename):
+    """发送静态文件，客户端支持时优先发送预压缩版本"""
+    static_folder = current_app.static_folder
+    # 只有清单中登记的带哈希文件才能长期缓存，清单本身等文件不在其列
+    hashed = filename in current_app.extensions.get('asset_manifest', {}).values()
+    max_age = IMMUTABLE_MAX_AGE if hashed else current_app.get_send_file_max_age(filename)
+
+    response = None
+    for encoding, suffix in ENCODINGS:
+        if request.accept_encodings.quality(encoding) <= 0:
+            continue
+        path = safe_join(static_folder, filename + suffix)
+        if path and os.path.isfile(path):
+            mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+            response = send_from_directory(static_folder, filename + suffix,
+                                           mimetype=mimetype, max_age=max_age)
+            response.headers['Content-Encoding'] = encoding
+            break
+
+    if response is None:
+        response = send_from_directory(static_folder, filename, max_age=max_age)
+
+    response.vary.add('Accept-Encoding')
+    if hashed:
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+    return response
+
+
+def minify_css(content):
+    """去除注释和多余空白"""
+    content = re.sub(r'/\*.*?\*/', '', content, flags=re.S)
+    content = re.sub(r'\s+', ' ', content)
+    content = re.sub(r'\s*([{};,])\s*', r'\1', content)
+    content = re.sub(r':\s+', ':', content)
+    return content.replace(';}', '}').strip()
+
+
+# 参与构建的文件类型及其压缩函数
+# JS 没有可靠的纯 Python 压缩方式，只做内容哈希和预压缩，gzip/brotli 已去除大部分空白开销
+MINIFIERS = {'.css': minify_css, '.js': None}
+
+
+def build_assets(static_folder):
+    """
+    构建静态资源
+
+    Returns:
+        dict: 原始路径到哈希文件路径的映射
+    """
+    dist = os.path.join(static_folder, DIST_DIR)
+    shutil.rmtree(dist, ignore_errors=True)
+
+    manifest = {}
+    for asset_dir in ASSET_DIRS:
+        source_dir = os.path.join(static_folder, asset_dir)
+        if not os.path.isdir(source_dir):
+            continue
+        for name in sorted(os.listdir(source_dir)):
+            base, ext = os.path.splitext(name)
+            if ext not in MINIFIERS:
+                continue
+            with open(os.path.join(source_dir, name), encoding='utf-8') as f:
+                content = f.read()
+            if MINIFIERS[ext] is not None:
+                content = MINIFIERS[ext](content)
+            data = content.encode('utf-8')
+
+            digest = hashlib.sha256(data).hexdigest()[:12]
+            target = f'{asset_dir}/{base}.{digest}{ext}'
+            _write_variants(os.path.join(dist, target), data)
+            manifest[f'{asset_dir}/{name}'] = f'{DIST_DIR}/{target}'
+
+    os.makedirs(dist, exist_ok=True)
+    with open(os.path.join(dist, MANIFEST_NAME), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+def _write_variants(path, data):
+    """写入原文件及 gzip/brotli 预压缩版本"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+    with open(path + '.gz', 'wb') as f:
+        f.write(gzip.compress(data, compresslevel=9, mtime=0))
+    if brotli is not None:
+        with open(path + '.br', 'wb') as f:
+            f.write(brotli.compress(data, quality=11))
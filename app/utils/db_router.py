@@ -0,0 +1,164 @@
+"""
+数据库读写分离路由
+写操作与兑换分配始终走主库，后台只读查询可路由到只读副本
+"""
+import random
+import time
+from functools import wraps
+from flask import current_app, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import text
+from sqlalchemy.sql import Select
+
+# 副本在 SQLALCHEMY_BINDS 中的键名前缀
+REPLICA_BIND_PREFIX = 'replica_'
+
+# 副本健康检查缓存: {bind_key: (检查时间, 是否可用)}
+_replica_health = {}
+
+
+class RoutingSession(Session):
+    """
+    读写路由 Session
+
+    仅当会话被标记为只读（见 read_replica）且本会话尚未发生写入时，
+    SELECT 才会发往延迟达标的副本；其余情况一律使用主库。
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is not None:
+            return bind
+
+        engine = super().get_bind(mapper=mapper, clause=clause, **kwargs)
+
+        if self._flushing or not isinstance(clause, Select):
+            if clause is not None or self._flushing:
+                self.info['wrote'] = True
+            return engine
+
+        if not self.info.get('use_replica') or self.info.get('wrote'):
+            return engine
+
+        # 只有默认库才有副本，其他 bind 保持原样
+        if engine is not self._db.engine:
+            return engine
+
+        replica = _pick_replica(self._db)
+        return replica if replica is not None else engine
+
+    def flush(self, objects=None):
+        if self.new or self.dirty or self.deleted:
+            self.info['wrote'] = True
+        super().flush(objects)
+
+
+def replica_bind(url, connect_timeout):
+    """
+    副本 bind 配置
+
+    设置较短的连接超时，健康检查在后台请求中执行，不可达的副本不能拖住请求
+    """
+    bind = {'url': url}
+    scheme = url.split(':', 1)[0].split('+', 1)[0]
+    if scheme in ('postgresql', 'postgres', 'mysql', 'mariadb'):
+        bind['connect_args'] = {'connect_timeout': max(1, int(connect_timeout))}
+    return bind
+
+
+def replica_bind_keys(app):
+    """返回已配置的副本 bind 键"""
+    binds = app.config.get('SQLALCHEMY_BINDS') or {}
+    return sorted(k for k in binds if k and k.startswith(REPLICA_BIND_PREFIX))
+
+
+def _pick_replica(db):
+    """随机选择一个延迟可接受的副本，全部不可用时返回 None"""
+    keys = replica_bind_keys(current_app)
+    random.shuffle(keys)
+    for key in keys:
+        if _replica_healthy(db, key):
+            return db.engines[key]
+    return None
+
+
+def _replica_healthy(db, key):
+    """检查副本复制延迟，结果按 DATABASE_REPLICA_CHECK_INTERVAL 缓存"""
+    interval = current_app.config['DATABASE_REPLICA_CHECK_INTERVAL']
+    now = time.monotonic()
+    cached = _replica_health.get(key)
+    if cached and now - cached[0] < interval:
+        return cached[1]
+
+    try:
+        lag = _replica_lag(db.engines[key])
+        healthy = lag is not None and lag <= current_app.config['DATABASE_REPLICA_MAX_LAG']
+    except Exception as e:
+        current_app.logger.warning(f"Replica {key} health check failed: {e}")
+        healthy = False
+
+    _replica_health[key] = (now, healthy)
+    return healthy
+
+
+def _replica_lag(engine):
+    """
+    查询副本复制延迟（秒）
+
+    Returns:
+        float | None: 延迟秒数，复制中断时返回 None
+    """
+    dialect = engine.dialect.name
+    with engine.connect() as conn:
+        if dialect == 'postgresql':
+            # WAL 接收进程未处于 streaming 时接收位置不再前进，"已追平" 不可信，视为不可用；
+            # 追平时返回 0，主库空闲时回放时间戳不会更新，不能直接作为延迟
+            lag = conn.execute(text(
+                "SELECT CASE "
+                "WHEN NOT EXISTS (SELECT 1 FROM pg_stat_wal_receiver WHERE status = 'streaming') THEN NULL "
+                "WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+                "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+            )).scalar()
+            return float(lag) if lag is not None else None
+        if dialect in ('mysql', 'mariadb'):
+            try:
+                row = conn.execute(text("SHOW REPLICA STATUS")).mappings().first()
+                column = 'Seconds_Behind_Source'
+            except Exception:
+                row = conn.execute(text("SHOW SLAVE STATUS")).mappings().first()
+                column = 'Seconds_Behind_Master'
+            if row is None:
+                # 配置为副本却没有复制状态（如执行过 RESET REPLICA ALL），无法保证数据一致
+                return None
+            lag = row.get(column)
+            return float(lag) if lag is not None else None
+        # SQLite 等无复制概念的数据库
+        conn.execute(text("SELECT 1"))
+        return 0.0
+
+
+def _primary_pinned():
+    """刚发生过写操作的管理员在短时间内固定读主库，保证读到自己的写入"""
+    return session.get('db_primary_until', 0) > time.time()
+
+
+def read_replica(f):
+    """将视图内的查询标记为只读，允许路由到副本"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if replica_bind_keys(current_app) and not _primary_pinned():
+            current_app.extensions['sqlalchemy'].session().info['use_replica'] = True
+        return f(*args, **kwargs)
+    return decorated_function
+
+
+def init_app(app, db):
+    """注册请求钩子：写入后在会话中记录主库固定期限"""
+    if not replica_bind_keys(app):
+        return
+
+    @app.after_request
+    def pin_primary_after_write(response):
+        # 只为已有会话的用户（管理员）记录，公开接口不额外下发 Cookie
+        if session and db.session().info.get('wrote'):
+            session['db_primary_until'] = time.time() + app.config['DATABASE_REPLICA_MAX_LAG']
+        return response
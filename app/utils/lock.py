@@ -4,7 +4,7 @@ Redis 分布式锁实现
 """
 import time
 from contextlib import contextmanager
-from app import redis_client
+from app import get_redis
 
 
 class RedisLock:
@@ -19,6 +19,7 @@ class RedisLock:
     
     def acquire(self):
         """获取锁"""
+        redis_client = get_redis()
         if redis_client is None:
             # Redis 不可用时直接返回成功（降级处理）
             self.locked = True
@@ -35,6 +36,7 @@ class RedisLock:
     
     def release(self):
         """释放锁"""
+        redis_client = get_redis()
         if redis_client is None:
             self.locked = False
             return
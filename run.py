@@ -1,12 +1,18 @@
 """
 应用入口
+
+生产环境: gunicorn --preload run:app（应用在主进程构建，worker fork 后按需建立连接）
+首次部署: flask --app run init-db
 """
 from dotenv import load_dotenv
 load_dotenv()
 
-from app import create_app
+from app import create_app, db
 
 app = create_app()
 
 if __name__ == '__main__':
+    # 本地开发单进程运行，直接建表方便调试
+    with app.app_context():
+        db.create_all(bind_key=None)
     app.run(host='0.0.0.0', port=5000, debug=True)
@@ -0,0 +1,78 @@
+"""
+启动耗时基准测试
+以 gunicorn --preload 启动服务，测量从冷启动到第一个请求成功返回的时间，
+覆盖主进程构建应用、fork worker 及 worker 内按需建立连接的完整路径
+
+用法: python scripts/bench_startup.py [--runs 5] [--workers 2] [--path /]
+"""
+import argparse
+import os
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port():
+    """获取一个空闲端口"""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def run_once(path, workers, timeout):
+    """启动一个全新的 gunicorn，返回 (耗时秒数, 状态码)"""
+    port = free_port()
+    url = f'http://127.0.0.1:{port}{path}'
+    cmd = [sys.executable, '-m', 'gunicorn', '--preload', '--bind', f'127.0.0.1:{port}',
+           '--workers', str(workers), '--threads', '4', 'run:app']
+
+    start = time.perf_counter()
+    server = subprocess.Popen(cmd, cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while True:
+            if server.poll() is not None:
+                raise RuntimeError(f'gunicorn exited with code {server.returncode}')
+            if time.perf_counter() - start > timeout:
+                raise RuntimeError(f'no response from {url} within {timeout}s')
+            try:
+                with urllib.request.urlopen(url, timeout=1) as response:
+                    return time.perf_counter() - start, response.status
+            except (urllib.error.URLError, ConnectionError, socket.timeout):
+                time.sleep(0.01)
+    finally:
+        server.send_signal(signal.SIGTERM)
+        try:
+            server.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            server.kill()
+            server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='gunicorn 冷启动到首个请求的耗时')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--path', default='/')
+    parser.add_argument('--timeout', type=float, default=30)
+    args = parser.parse_args()
+
+    timings = []
+    for i in range(args.runs):
+        elapsed, status = run_once(args.path, args.workers, args.timeout)
+        timings.append(elapsed)
+        print(f"run {i + 1}: {elapsed * 1000:.1f} ms (HTTP {status})")
+
+    print(f"min {min(timings) * 1000:.1f} ms, "
+          f"median {statistics.median(timings) * 1000:.1f} ms, "
+          f"max {max(timings) * 1000:.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,39 @@
+"""
+静态资源管线测试
+"""
+import pytest
+from app import create_app
+from app.utils import assets
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    monkeypatch.setenv('DATABASE_URL', f'sqlite:///{tmp_path / "nexus.db"}')
+    monkeypatch.setenv('DATABASE_REPLICA_URLS', '')
+    app = create_app()
+    app.static_folder = str(tmp_path / 'static')
+    (tmp_path / 'static' / 'js').mkdir(parents=True)
+    (tmp_path / 'static' / 'js' / 'main.js').write_text('/* init */ init();\n')
+    app.extensions['asset_manifest'] = assets.build_assets(app.static_folder)
+    return app
+
+
+def test_hashed_asset_is_immutable_and_precompressed(app):
+    url = app.extensions['asset_manifest']['js/main.js']
+    response = app.test_client().get(f'/static/{url}', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert response.cache_control.immutable
+    assert response.cache_control.max_age == assets.IMMUTABLE_MAX_AGE
+
+
+def test_js_content_kept_as_is(app):
+    url = app.extensions['asset_manifest']['js/main.js']
+    response = app.test_client().get(f'/static/{url}', headers={'Accept-Encoding': 'identity'})
+    assert response.get_data(as_text=True) == '/* init */ init();\n'
+
+
+def test_manifest_not_immutable(app):
+    response = app.test_client().get(f'/static/{assets.DIST_DIR}/{assets.MANIFEST_NAME}')
+    assert response.status_code == 200
+    assert not response.cache_control.immutable
+    assert response.cache_control.max_age != assets.IMMUTABLE_MAX_AGE
@@ -0,0 +1,122 @@
+"""
+读写分离路由测试：用两个 SQLite 文件分别充当主库和副本
+"""
+import pytest
+from app import create_app, db
+from app.models import Group, Job, RedeemCode
+from app.services import job_service
+from app.utils import db_router
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    monkeypatch.setenv('DATABASE_URL', f'sqlite:///{tmp_path / "primary.db"}')
+    monkeypatch.setenv('DATABASE_REPLICA_URLS', f'sqlite:///{tmp_path / "replica.db"}')
+    monkeypatch.setenv('JOB_EXPORT_DIR', str(tmp_path / 'exports'))
+    monkeypatch.setenv('REDIS_URL', 'redis://127.0.0.1:1/0')
+    monkeypatch.setenv('JOB_POLL_INTERVAL', '0.05')
+    db_router._replica_health.clear()
+
+    app = create_app()
+    app.config['TESTING'] = True
+    with app.app_context():
+        db.create_all(bind_key=None)
+        db.metadata.create_all(db.engines['replica_0'])
+        # 两个库写入不同数据，通过页面内容判断查询落在哪个库
+        db.session.add(Group(name='from-primary'))
+        db.session.commit()
+        with db.engines['replica_0'].begin() as conn:
+            conn.execute(Group.__table__.insert().values(name='from-replica'))
+        db.session.remove()
+
+    yield app
+    db_router._replica_health.clear()
+
+
+@pytest.fixture
+def client(app):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['admin_logged_in'] = True
+    return client
+
+
+def test_read_only_views_use_replica(client):
+    body = client.get('/console/groups').get_data(as_text=True)
+    assert 'from-replica' in body
+    assert 'from-primary' not in body
+
+
+def test_reads_pinned_to_primary_after_write(client):
+    response = client.post('/console/groups/add', data={'name': 'new-group'})
+    assert response.status_code == 302
+
+    body = client.get('/console/groups').get_data(as_text=True)
+    assert 'from-primary' in body
+    assert 'new-group' in body
+    assert 'from-replica' not in body
+
+
+def test_write_in_same_session_pins_primary(app):
+    with app.test_request_context():
+        session = db.session()
+        session.info['use_replica'] = True
+        assert Group.query.filter_by(name='from-replica').count() == 1
+
+        db.session.add(Group(name='written'))
+        db.session.flush()
+        assert Group.query.filter_by(name='written').count() == 1
+        assert Group.query.filter_by(name='from-replica').count() == 0
+        db.session.rollback()
+
+
+def test_falls_back_to_primary_when_replica_unhealthy(client, monkeypatch):
+    def broken(engine):
+        raise RuntimeError('replica down')
+
+    monkeypatch.setattr(db_router, '_replica_lag', broken)
+    body = client.get('/console/groups').get_data(as_text=True)
+    assert 'from-primary' in body
+    assert 'from-replica' not in body
+
+
+def test_falls_back_to_primary_when_replica_lagging(client, monkeypatch):
+    monkeypatch.setattr(db_router, '_replica_lag', lambda engine: 60.0)
+    body = client.get('/console/groups').get_data(as_text=True)
+    assert 'from-primary' in body
+
+
+def test_falls_back_to_primary_when_replication_broken(client, monkeypatch):
+    monkeypatch.setattr(db_router, '_replica_lag', lambda engine: None)
+    body = client.get('/console/groups').get_data(as_text=True)
+    assert 'from-primary' in body
+
+
+def test_replica_bind_sets_connect_timeout():
+    bind = db_router.replica_bind('postgresql+psycopg2://user@replica/nexus', 2)
+    assert bind['connect_args'] == {'connect_timeout': 2}
+    assert 'connect_args' not in db_router.replica_bind('sqlite:////tmp/replica.db', 2)
+
+
+def test_export_job_scans_replica(app, client):
+    with app.app_context():
+        db.session.add(RedeemCode(code='PRIMARY', group_id=1))
+        db.session.commit()
+        with db.engines['replica_0'].begin() as conn:
+            conn.execute(RedeemCode.__table__.insert(), [
+                {'code': 'REPLICA1', 'group_id': 1, 'status': 'unused'},
+                {'code': 'REPLICA2', 'group_id': 1, 'status': 'unused'},
+            ])
+
+    # 提交任务时的计数也读副本
+    client.post('/console/codes/export', data={'group_id': '', 'status': 'unused'})
+
+    with app.app_context():
+        job = Job.query.one()
+        assert job.total == 2
+        job_service.run_worker(once=True)
+
+        job = Job.query.one()
+        assert job.status == 'succeeded'
+        with open(job_service.export_path(job)) as f:
+            assert f.read() == 'REPLICA1\nREPLICA2\n'
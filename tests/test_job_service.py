@@ -0,0 +1,159 @@
+"""
+后台任务测试：分块执行、接管保护与崩溃回收
+"""
+import os
+import pytest
+from sqlalchemy.exc import OperationalError
+from app import create_app, db
+from app.models import Card, Group, Job, RedeemCode
+from app.services import job_service
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    monkeypatch.setenv('DATABASE_URL', f'sqlite:///{tmp_path / "nexus.db"}')
+    monkeypatch.setenv('DATABASE_REPLICA_URLS', '')
+    monkeypatch.setenv('REDIS_URL', 'redis://127.0.0.1:1/0')
+    monkeypatch.setenv('JOB_EXPORT_DIR', str(tmp_path / 'exports'))
+    monkeypatch.setenv('JOB_CHUNK_SIZE', '2')
+    monkeypatch.setenv('JOB_CHUNK_PAUSE', '0')
+    monkeypatch.setenv('JOB_POLL_INTERVAL', '0.05')
+
+    app = create_app()
+    with app.app_context():
+        db.create_all(bind_key=None)
+        db.session.add(Group(name='group'))
+        db.session.commit()
+        yield app
+        db.session.remove()
+
+
+def test_import_runs_in_chunks(app):
+    lines = [f'user{i}----pass{i}' for i in range(5)] + ['invalid']
+    job_id = job_service.enqueue('import_cards', {'group_id': 1, 'lines': lines}, total=len(lines)).id
+
+    job_service.run_worker(once=True)
+
+    job = db.session.get(Job, job_id)
+    assert job.status == 'succeeded'
+    assert job.progress == 6
+    assert Card.query.count() == 5
+
+
+def test_export_writes_download_file(app):
+    for i in range(3):
+        db.session.add(RedeemCode(code=f'CODE{i}', group_id=1))
+    db.session.commit()
+    job_id = job_service.enqueue('export_codes', {'group_id': None, 'status': 'unused'}, total=3).id
+
+    job_service.run_worker(once=True)
+
+    job = db.session.get(Job, job_id)
+    assert job.status == 'succeeded'
+    with open(job_service.export_path(job)) as f:
+        assert f.read() == 'CODE0\nCODE1\nCODE2\n'
+
+
+def test_chunk_discarded_after_takeover(app, monkeypatch):
+    lines = [f'user{i}----pass{i}' for i in range(4)]
+    job_service.enqueue('import_cards', {'group_id': 1, 'lines': lines}, total=len(lines))
+    job_id, attempts = job_service._claim_next_job('host:1:aaaa')
+
+    def import_then_taken_over(job, params, state):
+        result = job_service._import_cards(job, params, state)
+        # 模拟另一个 worker 在本块处理期间接管了任务
+        with db.engine.begin() as conn:
+            conn.execute(db.update(Job).where(Job.id == job_id).values(attempts=attempts + 1))
+        return result
+
+    monkeypatch.setitem(job_service.JOB_HANDLERS, 'import_cards', import_then_taken_over)
+    job_service._run_job(job_id, attempts)
+
+    assert Card.query.count() == 0
+    assert db.session.get(Job, job_id).progress == 0
+
+
+def test_concurrency_limit_enforced_on_claim(app):
+    app.config['JOB_CONCURRENCY'] = 1
+    job_service.enqueue('reconcile', {})
+    job_service.enqueue('reconcile', {})
+
+    assert job_service._claim_next_job('host:1:aaaa') is not None
+    assert job_service._claim_next_job('host:2:bbbb') is None
+
+
+def test_orphaned_job_requeued_immediately(app):
+    job = job_service.enqueue('reconcile', {})
+    host = 'test-host'
+    job_service._claim_next_job(f'{host}:{os.getpid()}:old')
+
+    # 同一主机、同一 pid 但启动标识不同：上一个 worker 已退出
+    job_service._requeue_orphaned_jobs(f'{host}:{os.getpid()}:new')
+
+    job = db.session.get(Job, job.id)
+    assert job.status == 'pending'
+    assert job.worker is None
+
+
+def test_live_worker_job_not_requeued(app):
+    job = job_service.enqueue('reconcile', {})
+    worker_id = f'test-host:{os.getpid()}:same'
+    job_service._claim_next_job(worker_id)
+
+    job_service._requeue_orphaned_jobs(worker_id)
+
+    assert db.session.get(Job, job.id).status == 'running'
+
+
+def test_import_clears_credentials_on_success(app):
+    job_id = job_service.enqueue('import_cards', {'group_id': 1, 'lines': ['user----pass']}, total=1).id
+
+    job_service.run_worker(once=True)
+
+    job = db.session.get(Job, job_id)
+    assert job.status == 'succeeded'
+    assert job.get_params() == {'group_id': 1}
+
+
+def test_transient_db_error_requeues_from_checkpoint(app, monkeypatch):
+    lines = [f'user{i}----pass{i}' for i in range(4)]
+    job_service.enqueue('import_cards', {'group_id': 1, 'lines': lines}, total=len(lines))
+    job_id, attempts = job_service._claim_next_job('host:1:aaaa')
+    calls = []
+
+    def import_then_locked(job, params, state):
+        calls.append(state.get('offset', 0))
+        if len(calls) == 2:
+            raise OperationalError('INSERT', {}, Exception('database is locked'))
+        return job_service._import_cards(job, params, state)
+
+    monkeypatch.setitem(job_service.JOB_HANDLERS, 'import_cards', import_then_locked)
+    job_service._run_job(job_id, attempts)
+
+    job = db.session.get(Job, job_id)
+    assert job.status == 'pending'
+    assert job.worker is None
+    assert job.progress == 2
+
+    # 再次领取后从断点继续，不重复导入
+    job_id, attempts = job_service._claim_next_job('host:1:aaaa')
+    job_service._run_job(job_id, attempts)
+    db.session.expire_all()
+    assert db.session.get(Job, job_id).status == 'succeeded'
+    assert Card.query.count() == 4
+
+
+def test_transient_db_error_fails_when_attempts_exhausted(app, monkeypatch):
+    app.config['JOB_MAX_ATTEMPTS'] = 1
+    job_service.enqueue('import_cards', {'group_id': 1, 'lines': ['user----pass']}, total=1)
+    job_id, attempts = job_service._claim_next_job('host:1:aaaa')
+
+    def locked(job, params, state):
+        raise OperationalError('INSERT', {}, Exception('database is locked'))
+
+    monkeypatch.setitem(job_service.JOB_HANDLERS, 'import_cards', locked)
+    job_service._run_job(job_id, attempts)
+
+    job = db.session.get(Job, job_id)
+    assert job.status == 'failed'
+    assert 'lines' not in job.get_params()
@@ -0,0 +1,17 @@
+"""
+后台任务 worker 入口
+
+用法: python worker.py [--once]
+"""
+import sys
+from dotenv import load_dotenv
+load_dotenv()
+
+from app import create_app
+from app.services.job_service import run_worker
+
+app = create_app()
+
+if __name__ == '__main__':
+    with app.app_context():
+        run_worker(once='--once' in sys.argv[1:])